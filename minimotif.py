@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from minimotif_scripts import *
+from minimotif_scripts.logger import positive_int
 import argparse
 import os
 import json as jsonlib
@@ -47,6 +48,7 @@ Optional arguments:
         less than the global alignment between pHMM models and the query
         sequence. Default: 1
     -am Analysis mode. Default: auto (gapped, ungapped, both)
+    -t  Number of threads used for the PWM detection module. Default: all available CPUs
 -_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-
 ''')
 
@@ -83,10 +85,14 @@ parser.add_argument("-la", "--adjust_length", type=float,
                     help=argparse.SUPPRESS, required=False, default=1)
 parser.add_argument('-am', '--analysis_mode', help= argparse.SUPPRESS, choices=['auto', 'gapped', 'ungapped', 'both'],
                     default='auto', required=False)
+parser.add_argument("-t", "--threads", type=positive_int, help=argparse.SUPPRESS,
+                    required=False, default=None)
 
 
 args = parser.parse_args() # parse arguments
 GB_REGIONS = {}  # dictionary to store the genbank regions
+# region files of every genome are kept striped in memory across regulators, up to a fixed limit
+PWM_CACHE_SIZE = min((2 if args.coding else 1) * len(args.genbank), MAX_BATCH_CACHE_SIZE)
 
 if not os.path.exists(args.outdir):
     os.mkdir(args.outdir)
@@ -207,7 +213,7 @@ try:
                                         mode = "positional_masking"
                                         run_pwm_detection(genbank_file, pfm, args.pseudocount, reg_name,
                                                           GB_REGIONS[genbank_file], args.coding, args.pvalue, args.batch,
-                                                          args.outdir)
+                                                          args.outdir, args.threads, PWM_CACHE_SIZE)
                                         hmm_models = prep_hmm_detection(input_file, reg_name, mode, ic_threshold,
                                                                         args.outdir)
                                         run_hmm_detection(genbank_file, reg_name, hmm_models, args.coding,
@@ -219,7 +225,7 @@ try:
                                             f"detection for a ungapped sequence motif[/bold cyan]")
                                         run_pwm_detection(genbank_file, pfm, args.pseudocount, reg_name,
                                                           GB_REGIONS[genbank_file], args.coding, args.pvalue, args.batch,
-                                                          args.outdir)
+                                                          args.outdir, args.threads, PWM_CACHE_SIZE)
 
                                 else:  # run PWM detection for short sequence motifs
                                     logger.log(
@@ -227,7 +233,7 @@ try:
                                         f" for a short sequence motif[/bold cyan]")
                                     run_pwm_detection(genbank_file, pfm, args.pseudocount, reg_name,
                                                       GB_REGIONS[genbank_file], args.coding, args.pvalue, args.batch,
-                                                      args.outdir)
+                                                      args.outdir, args.threads, PWM_CACHE_SIZE)
                             elif args.analysis_mode == 'gapped':
                                 logger.log(
                                     f"[bold cyan]Running HMM detection "
@@ -241,7 +247,8 @@ try:
                                     f"[bold cyan]Running PWM detection "
                                     f"for a ungapped sequence motif[/bold cyan]")
                                 run_pwm_detection(genbank_file, pfm, args.pseudocount, reg_name, GB_REGIONS[genbank_file],
-                                                  args.coding, args.pvalue, args.batch, args.outdir)
+                                                  args.coding, args.pvalue, args.batch, args.outdir, args.threads,
+                                                  PWM_CACHE_SIZE)
                             elif args.analysis_mode == 'both':
                                 logger.log(
                                     f"[bold cyan]Running both HMM and PWM"
@@ -251,7 +258,7 @@ try:
                                 mode = "positional_masking"
                                 run_pwm_detection(genbank_file, pfm, args.pseudocount, reg_name,
                                                   GB_REGIONS[genbank_file], args.coding, args.pvalue, args.batch,
-                                                  args.outdir)
+                                                  args.outdir, args.threads, PWM_CACHE_SIZE)
                                 hmm_models = prep_hmm_detection(input_file, reg_name, mode, ic_threshold, args.outdir)
                                 run_hmm_detection(genbank_file, reg_name, hmm_models, args.coding,
                                                   args.adjust_length, args.outdir, gene_strand_dict, product_dict)
@@ -1,22 +1,37 @@
 """ Script containing all functions for TFBS detection using PWMs """
 
 import collections
+import concurrent.futures
+import functools
+import io
+import numpy as np
 import pandas as pd
-import seqlogo
-from collections import Counter
 import os
 import subprocess
 from rich.console import Console
 from datetime import datetime
 from minimotif_scripts.logger import logger
-from Bio import SeqIO
 import itertools
+from multiprocessing.pool import ThreadPool
 import re
+import threading
 import lightmotif
 
 
 console = Console()
 
+MOODS_COLUMNS = ["ID", "PWM", "loc", "strand", "score", "seq", "no"]
+HEADER_RX = re.compile("([^~]*)~([0-9]+):([0-9]+)~(.*)")
+RECORDS_PER_BATCH = 256
+BATCH_CACHE_SIZE = 2
+MAX_BATCH_CACHE_SIZE = 8  # keep at most 8 region files striped in memory
+BATCH_CACHE = collections.OrderedDict()
+BATCH_CACHE_LOCK = threading.Lock()
+RESULT_COLUMNS = ["Region", "Start", "End", "Strand", "Score", "Confidence", "Sequence"]
+STRANDS = ["+", "-"]
+CONFIDENCES = ["weak", "medium", "strong"]
+COMPLEMENT = str.maketrans("ACGTRYKMBVDHNacgtrykmbvdhn", "TGCAYRMKVBHDNtgcayrmkvbhdn")
+
 def create_pwm(pfm, pscount, outdir, reg_name):
     """ creates a position wight matrix of a position frequency matrix
 
@@ -28,17 +43,22 @@ def create_pwm(pfm, pscount, outdir, reg_name):
     pwm: position weight matrix as dataframe
     """
     pwm_file = f"{outdir}/{reg_name}_PWM.tsv"
-    pwm = (seqlogo.pfm2pwm(pd.DataFrame.from_dict(pfm), background=None, pseudocount=pscount)).T
-    pwm.to_csv(pwm_file, sep="\t", index=False, index_label=False, header=False)
-    return pwm_file, pwm
+    counts = np.array([pfm[base] for base in "ACGT"], dtype=np.float64)
+    ppm = counts / counts.sum(axis=0)
+    # log-odds against a uniform background, as computed by `seqlogo.pfm2pwm`
+    pwm = np.log2(ppm + float(pscount)) - np.log2(0.25)
+    np.savetxt(pwm_file, pwm, delimiter="\t", fmt="%s")
+    return pwm_file, pd.DataFrame(pwm, index=list("ACGT"))
 
 
 def get_sequence_gc_content(sequence):
     """ calculate the GC content of the bgc region's sequence
     :param sequence: str, DNA sequence
     :returns: float, GC content """
-    counter = Counter(sequence)
-    return sum(counter[char] for char in "GC") / len(sequence)
+    # clear the lowercase bit of ASCII letters to count soft-masked bases as well
+    nucleotides = np.frombuffer(str(sequence).encode("ascii"), dtype=np.uint8) & 0xDF
+    gc_count = np.count_nonzero((nucleotides == ord("G")) | (nucleotides == ord("C")))
+    return gc_count / len(nucleotides)
 
 
 def get_bg_distribution(sequence):
@@ -65,66 +85,127 @@ def run_moods(fasta_file, pwm, reg_type, reg_name, outdir, bg_dist,
     :param gb_name: str, name of the genbank file
     :param threshold: float, detection threshold value
     :param batch: True/False, run MOODS in batch mode
-    :returns: outfile: path to MOODS output file
+    :returns: moods_results: MOODS hits as dataframe
     """
 
     outfile = f"{outdir}/{reg_name}_{gb_name}_{reg_type}.moods"
+    if os.path.exists(outfile):
+        # reuse the results of a previous run
+        return read_moods(outfile)
 
+    cmd_moods = ["moods-dna.py", "-S", pwm, "-s", fasta_file,
+                 "-p", str(threshold), "--bg", *bg_dist.split()]
     if batch:
-        cmd_moods = f"moods-dna.py -S {pwm} -s {fasta_file} -o {outfile} " \
-                f"-p {threshold} --bg {bg_dist} --batch"
-    else:
-        cmd_moods = f"moods-dna.py -S {pwm} -s {fasta_file} -o {outfile} " \
-                f"-p {threshold} --bg {bg_dist}"
+        cmd_moods.append("--batch")
 
+    # parse the MOODS output while it is being written to stdout, and copy it
+    # to a temporary file that only replaces the output file once MOODS succeeded
+    partial_file = f"{outfile}.part"
     try:
-        if not os.path.exists(outfile):
-            res_map = subprocess.check_output(cmd_moods, shell=True,
-                                              stderr=subprocess.STDOUT)
-    except(subprocess.CalledProcessError):
+        with subprocess.Popen(cmd_moods, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              bufsize=1 << 20) as process, \
+                open(partial_file, "wb") as moods_file, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            # drain stderr in the background so that MOODS never blocks on it
+            stderr = executor.submit(process.stderr.read)
+            try:
+                moods_results = read_moods(io.BufferedReader(TeeStream(process.stdout, moods_file)))
+            except BaseException:
+                # stop MOODS, otherwise it blocks writing to a stdout nobody reads
+                process.kill()
+                raise
+            errors = stderr.result().decode(errors="replace").strip()
+        returncode = process.returncode
+    except OSError as error:
+        returncode, errors = None, str(error)
+    except BaseException:
+        remove_file(partial_file)
+        raise
+    if returncode != 0:
+        remove_file(partial_file)
         logger.log(
-            f"[bold red]Unable to run moods with command: {cmd_moods}[/bold red]")
-    return outfile
+            f"[bold red]Unable to run moods with command: {' '.join(cmd_moods)}"
+            f"\n{errors}[/bold red]")
+        return pd.DataFrame(columns=MOODS_COLUMNS)
+    os.replace(partial_file, outfile)
+    return moods_results
+
+
+def remove_file(filename):
+    """ Remove a file if it exists
+    :param filename: path to the file
+    """
+    if os.path.exists(filename):
+        os.remove(filename)
+
+
+class TeeStream(io.RawIOBase):
+    """ Readable stream copying everything read from `stream` to `copy` """
+
+    def __init__(self, stream, copy):
+        """
+        :param stream: binary file object to read from
+        :param copy: binary file object the data read is written to
+        """
+        self.stream = stream
+        self.copy = copy
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read1(len(buffer))
+        buffer[:len(data)] = data
+        self.copy.write(data)
+        return len(data)
+
+
+def read_moods(moods_output):
+    """ read the hits reported by MOODS
+    :param moods_output: path or file object with the MOODS output
+    :returns: MOODS hits as dataframe
+    """
+    try:
+        return pd.read_csv(moods_output, header=None, names=MOODS_COLUMNS,
+                           dtype={"ID": str, "score": str, "seq": str})
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=MOODS_COLUMNS)
 
 
 def parse_moods(moods_results, reg_name, gb_name, reg_type, thres, outdir):
     """ parse results from MOODS output
-    :param moods_results: path to MOODS output file
+    :param moods_results: MOODS hits as dataframe
     :param outdir: path to the output directory
     :param reg_type: str, type of regulator
     :param reg_name: str, name of the regulator
     :param gb_name: str, name of the genbank file
     :param thres: float, threshold for detection
     """
-    out_dict = {}
-    with open(moods_results, "r") as moods_output:
-        for line in moods_output:
-            ID, PWM_name, loc, strand, score, seq, no = line.split(",")
-            region = ID.split("~")[0]
-            start_loc = ID.split("~")[1].split(":")[0]
-            stop_loc = ID.split("~")[1].split(":")[1]
-            full_start_loc = int(start_loc) + int(loc)
-            full_end_loc = int(start_loc) + int(loc) + int(len(seq))
-            full_loc = f"{full_start_loc}:{full_end_loc}"
-            conf = set_confidence(float(score), thres)
-
-            if "-" in region:
-                if not len(region.split('-')) > 2:
-                    first_gene, second_gene = region.split('-')
-                    range_region = ((int(stop_loc) - int(start_loc))/2) + int(start_loc)
-                    if full_start_loc <= range_region:
-                        region = first_gene
-                    else:
-                        region = second_gene
-            else:
-                region = region
-
-            if region not in out_dict.keys():
-                out_dict[region] = []
-                out_dict[region].append([full_loc, strand, score, conf, seq])
-            else:
-                out_dict[region].append([full_loc, strand, score, conf, seq])
-    write_output(out_dict, reg_name, gb_name, reg_type, outdir)
+    if moods_results.empty:
+        write_output(pd.DataFrame(columns=RESULT_COLUMNS), reg_name, gb_name, reg_type, outdir)
+        return
+
+    # parse each distinct record header only once
+    header_ids, headers = pd.factorize(moods_results["ID"])
+    region_starts, midpoints, genes = get_region_genes([parse_header(h) for h in headers])
+
+    full_start = region_starts[header_ids] + moods_results["loc"].to_numpy(np.int64)
+    full_end = full_start + moods_results["seq"].str.len().to_numpy(np.int64)
+    confidences = set_confidences(moods_results["score"].to_numpy(float), thres)
+
+    # assign hits in intergenic regions to the closest of the two genes
+    second_gene = (full_start > midpoints[header_ids]).astype(np.int64)
+
+    results = pd.DataFrame({
+        "Region": genes[header_ids, second_gene],
+        "Start": full_start,
+        "End": full_end,
+        "Strand": pd.Categorical(moods_results["strand"].to_numpy(), categories=STRANDS),
+        "Score": moods_results["score"].to_numpy(),
+        "Confidence": pd.Categorical(confidences, categories=CONFIDENCES),
+        "Sequence": moods_results["seq"].to_numpy(),
+    })
+    write_output(results, reg_name, gb_name, reg_type, outdir)
     return
 
 
@@ -141,90 +222,246 @@ def set_confidence(score, thresholds):
     return "medium"
 
 
+def set_confidences(scores, thresholds):
+    """ Vectorized version of `set_confidence` for an array of hit scores
+    :param scores: numpy array, hit scores
+    :param thresholds: float, hit threshold
+    :returns: numpy array of confidence labels
+    """
+    med_str_thres = (thresholds[1] + thresholds[0]) / 2
+    confidences = np.full(scores.shape, "medium", dtype="U6")
+    confidences[scores >= med_str_thres] = "strong"
+    confidences[scores <= thresholds[1]] = "weak"
+    return confidences
+
+
 def set_threshold(pwm):
     """ set a additional threshold to separate top hits from medium """
-    max_pwm = sum(pwm.max(numeric_only=True))
-    strict_threshold = 0
-    for val in (pwm.max().to_frame()).values:
-        if val >= 1.9:
-            strict_threshold = strict_threshold + val
-    return [max_pwm, strict_threshold[0]]
+    max_scores = np.asarray(pwm).max(axis=0)
+    max_pwm = float(max_scores.sum())
+    strict_threshold = float(max_scores[max_scores >= 1.9].sum())
+    return [max_pwm, strict_threshold]
 
 
-def write_output(results_dict, reg_name, gb_name, reg_type, outdir):
+def write_output(results, reg_name, gb_name, reg_type, outdir):
     """ Writes a tsv output file """
-    with open(f"{outdir}/{reg_name}_{gb_name}_{reg_type}_pwm_results.tsv", "w") as outfile:
-        outfile.write("Region\tLocation\tStrand\tScore\tConfidence\tSequence\n")
-        for key in results_dict.keys():
-            for i in results_dict[key]:
-                outfile.write(f"{key}\t{i[0]}\t{i[1]}\t{i[2]}\t{i[3]}\t{i[4]}\n")
+    # list the hits of each region together, in order of first appearance
+    region_ids, _ = pd.factorize(results["Region"])
+    results = results.iloc[np.argsort(region_ids, kind="stable")]
+    output = pd.DataFrame({
+        "Region": results["Region"],
+        "Location": results["Start"].astype(str) + ":" + results["End"].astype(str),
+        "Strand": results["Strand"],
+        "Score": results["Score"],
+        "Confidence": results["Confidence"],
+        "Sequence": results["Sequence"],
+    })
+    output.to_csv(f"{outdir}/{reg_name}_{gb_name}_{reg_type}_pwm_results.tsv",
+                  sep="\t", index=False)
     return
 
 
-def run_lightmotif(filename, pssm, pvalue_threshold, thresholds_pwm):
-    # compile a regular expression to parse the record headers
-    header_rx = re.compile("([^~]*)~([0-9]+):([0-9]+)~(.*)")
-    # compute matrix reverse-complement
-    pssm_rc = pssm.reverse_complement()
+def read_fasta(filename):
+    """ Read the records of a FASTA file without building Biopython objects
 
-    # scan all sequences in the input file
-    # NB(@althonos): This is embarassingly parallel and could be parallelized
-    #                using a `multiprocessing.pool.ThreadPool`.
-    results_dict = collections.defaultdict(list)
-    for record in SeqIO.parse(filename, "fasta"):
+    :param filename: path to the FASTA file
+    :returns: generator of (identifier, sequence) tuples
+    """
+    with open(filename, "r") as fasta:
+        contents = fasta.read()
+    if contents.startswith(">"):
+        contents = contents[1:]
+    for entry in contents.split("\n>"):
+        header, _, sequence = entry.partition("\n")
+        if header.strip():
+            yield header.split(maxsplit=1)[0], "".join(sequence.split())
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def parse_header(header):
+    """ Parse the header of a region record written by `write_fastas`
+
+    :param header: str, record identifier formatted as region~start:end~genome
+    :returns: tuple (region name, start coordinate, end coordinate)
+    """
+    try:
+        region, coords, _ = header.split("~", 2)
+        start, end = coords.split(":")
+        return region, int(start), int(end)
+    except ValueError:
+        region, start, end, _ = HEADER_RX.search(header).groups()
+        return region, int(start), int(end)
+
+
+def get_region_genes(headers):
+    """ Precompute the coordinates and genes of regions for hit assignment
+
+    Hits in a region between two genes belong to the first gene up to the
+    middle of the region, and to the second gene after it.
+
+    :param headers: list of (region name, start, end) tuples
+    :returns: tuple (region starts, region midpoints, genes) as numpy arrays,
+    with genes of shape (len(headers), 2) holding the first and second gene
+    """
+    region_starts = np.array([start for _, start, _ in headers], dtype=np.int64)
+    region_ends = np.array([end for _, _, end in headers], dtype=np.int64)
+    midpoints = (region_ends - region_starts) // 2 + region_starts
+    genes = [
+        region.split("-") if region.count("-") == 1 else [region, region]
+        for region, _, _ in headers
+    ]
+    genes = np.array(genes, dtype=object).reshape(len(headers), 2)
+    return region_starts, midpoints, genes
+
+
+def load_batches(filename, cache_size=BATCH_CACHE_SIZE):
+    """ Load the batches of a FASTA file, reusing them from previous calls
+
+    Batches are cached so that a file scanned with the PWMs of several
+    regulators is only read and striped once, and reloaded if the file was
+    modified since. Each cached file holds its sequence about twice in
+    memory (text and striped copy), so only the `cache_size` most recently
+    used files are kept.
+
+    :param filename: path to the FASTA file
+    :param cache_size: int, maximum number of files to keep in the cache
+    :returns: list of batches as returned by `read_batches`
+    """
+    mtime = os.path.getmtime(filename)
+    with BATCH_CACHE_LOCK:
+        cached = BATCH_CACHE.pop(filename, None)
+        if cached is not None and cached[0] == mtime:
+            BATCH_CACHE[filename] = cached
+            return cached[1]
+
+    batches = read_batches(filename)
+    with BATCH_CACHE_LOCK:
+        BATCH_CACHE[filename] = (mtime, batches)
+        while len(BATCH_CACHE) > cache_size:
+            BATCH_CACHE.popitem(last=False)
+    return batches
+
+
+def read_batches(filename):
+    """ Read and stripe the records of a FASTA file in batches
+
+    The records of each batch are joined with an N, so that the whole batch
+    is striped and scored with a single lightmotif call.
+
+    :param filename: path to the FASTA file
+    :returns: list of (sequence, striped sequence, record lengths, record
+    offsets, region genes) tuples
+    """
+    records = ((identifier, sequence) for identifier, sequence in read_fasta(filename) if sequence)
+    batches = []
+    for batch in iter(lambda: list(itertools.islice(records, RECORDS_PER_BATCH)), []):
+        # concatenate the sequences and record where each of them starts
+        lengths = np.array([len(sequence) for _, sequence in batch], dtype=np.int64)
+        offsets = np.zeros(len(batch), dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths[:-1] + 1)
+        sequence = "N".join(sequence for _, sequence in batch)
+        # parse sequence headers
+        headers = [parse_header(identifier) for identifier, _ in batch]
+        batches.append((sequence, lightmotif.stripe(sequence), lengths, offsets,
+                        get_region_genes(headers)))
+    return batches
 
-        if not record.seq:
-            continue
 
-        # prepare the sequence for lightmotif
-        striped_sequence = lightmotif.stripe(str(record.seq))
+def scan_batch(batch, pssm, pssm_rc, pvalue_threshold, thresholds_pwm):
+    """ Scan both strands of a batch of sequence records with lightmotif
 
-        # compute scores for both strands
-        fwd_scores = pssm.calculate(striped_sequence)
+    :param batch: tuple, batch of records as returned by `load_batches`
+    :param pssm: lightmotif.ScoringMatrix, scoring matrix of the motif
+    :param pssm_rc: lightmotif.ScoringMatrix, reverse-complement of pssm
+    :param pvalue_threshold: float, score threshold for detection
+    :param thresholds_pwm: list, thresholds to set the confidence of hits
+    :returns: hits as dataframe with `RESULT_COLUMNS` columns
+    """
+    sequence, striped_sequence, lengths, offsets, region_genes = batch
+    region_starts, midpoints, genes = region_genes
+    motif_length = len(pssm)
+
+    # compute scores for both strands, no match is possible if the
+    # whole batch is shorter than the motif
+    fwd_scores = pssm.calculate(striped_sequence)
+    if len(fwd_scores) == 0:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    if pssm_rc is pssm:
+        bwd_scores = fwd_scores
+    else:
         bwd_scores = pssm_rc.calculate(striped_sequence)
 
-        # extract indices above threshold for each strand
-        indices = itertools.chain(
-            zip(fwd_scores.threshold(pvalue_threshold), itertools.repeat("+")),
-            zip(bwd_scores.threshold(pvalue_threshold), itertools.repeat("-"))
-        )
+    # extract indices above threshold for each strand and map them back
+    # to their record, dropping matches that overlap a separator
+    hit_records, hit_indices, hit_strands, hit_scores, hit_seqs = [], [], [], [], []
+    for strand, scores in (("+", fwd_scores), ("-", bwd_scores)):
+        # the buffer of striped scores is the transposed score matrix,
+        # so flattening it gives the scores in sequence order
+        score_array = np.asarray(scores).ravel()
+        indices = np.sort(np.array(scores.threshold(pvalue_threshold), dtype=np.int64))
+        record_ids = np.searchsorted(offsets, indices, side="right") - 1
+        in_record = indices - offsets[record_ids] + motif_length <= lengths[record_ids]
+        indices = indices[in_record]
+        # get sequence of binding sites
+        seqs = [sequence[i:i+motif_length] for i in indices.tolist()]
+        if strand == "-":
+            seqs = [seq.translate(COMPLEMENT)[::-1] for seq in seqs]
+        hit_records.append(record_ids[in_record])
+        hit_indices.append(indices)
+        hit_strands.append(np.full(len(indices), strand))
+        hit_scores.append(score_array[indices].astype(np.float64))
+        hit_seqs.extend(seqs)
+
+    # group hits by record, keeping forward strand hits first
+    order = np.argsort(np.concatenate(hit_records), kind="stable")
+    hit_records = np.concatenate(hit_records)[order]
+    hit_indices = np.concatenate(hit_indices)[order]
+    hit_strands = np.concatenate(hit_strands)[order]
+    hit_scores = np.concatenate(hit_scores)[order]
+    hit_seqs = [hit_seqs[k] for k in order]
+
+    # compute coordinates, region and confidence of all hits at once
+    starts = region_starts[hit_records] + hit_indices - offsets[hit_records]
+    second_gene = (starts > midpoints[hit_records]).astype(np.int64)
+    confidences = set_confidences(hit_scores, thresholds_pwm)
+
+    # record results
+    return pd.DataFrame({
+        "Region": genes[hit_records, second_gene],
+        "Start": starts,
+        "End": starts + motif_length,
+        "Strand": pd.Categorical(hit_strands, categories=STRANDS),
+        "Score": hit_scores,
+        "Confidence": pd.Categorical(confidences, categories=CONFIDENCES),
+        "Sequence": hit_seqs,
+    })
+
+
+def run_lightmotif(filename, pssm, pvalue_threshold, thresholds_pwm, pool,
+                   cache_size=BATCH_CACHE_SIZE):
+    # compute matrix reverse-complement, palindromic motifs score the
+    # same on both strands so the sequences only need to be scored once
+    pssm_rc = pssm.reverse_complement()
+    if pssm_rc == pssm:
+        pssm_rc = pssm
+    scan = functools.partial(scan_batch, pssm=pssm, pssm_rc=pssm_rc,
+                             pvalue_threshold=pvalue_threshold,
+                             thresholds_pwm=thresholds_pwm)
 
-        # parse sequence headers
-        region_, start_, end_, _ = header_rx.search(record.id).groups()
-
-        # record results
-        for i, strand in indices:
-            # get match coordinates
-            start = int(start_) + i
-            end = start + len(pssm)
-            score = fwd_scores[i] if strand == "+" else bwd_scores[i]
-            # get proper region coordinates
-            if region_.count("-") == 1:
-                first_gene, second_gene = region_.split('-')
-                range_region = ((int(end_) - int(start_))/2) + int(start_)
-                if start <= range_region:
-                    region = first_gene
-                else:
-                    region = second_gene
-            else:
-                region = region_
-            # get sequence of binding site
-            seq = record.seq[i:i+len(pssm)]
-            if strand == "-":
-                seq = seq.reverse_complement()
-            # record match
-            results_dict[region].append([
-                f"{start}:{end}",
-                strand,
-                score,
-                set_confidence(score, thresholds_pwm),
-                seq,
-            ])
-
-    return results_dict
-
-
-def run_pwm_detection(genbank_file, pfm, pseudocount, reg_name, gbk_regions, coding, pvalue, batch, outdir):
+    # group the records in batches that are each scanned at once
+    batches = load_batches(filename, cache_size)
+
+    # scan all batches, lightmotif releases the GIL while scoring so
+    # batches can be processed in parallel threads
+    results = [hits for hits in pool.imap(scan, batches) if not hits.empty]
+
+    if not results:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat(results, ignore_index=True)
+
+
+def run_pwm_detection(genbank_file, pfm, pseudocount, reg_name, gbk_regions, coding, pvalue, batch, outdir,
+                      threads=None, cache_size=BATCH_CACHE_SIZE):
     """ Run MOODS to detect TFBS occurrences """
     gb_name = genbank_file.split("/")[-1].split(".")[0]
     bg_dis = get_bg_distribution(gbk_regions)  # bg distribution of the full genome
@@ -235,11 +472,18 @@ def run_pwm_detection(genbank_file, pfm, pseudocount, reg_name, gbk_regions, cod
     scoring_matrix = lightmotif.ScoringMatrix("ACGT", dict(A=list(pwm.loc["A"]), T=list(pwm.loc["T"]), G=list(pwm.loc["G"]), C=list(pwm.loc["C"])))
     pvalue_threshold = scoring_matrix.score(pvalue)
 
-    if coding:
-        co_fasta = f"{outdir}/{gb_name}_co_region.fasta"
-        results = run_lightmotif(co_fasta, scoring_matrix, pvalue_threshold, thresholds_pwm)
-        write_output(results, reg_name, gb_name, "co", outdir)
-
+    co_fasta = f"{outdir}/{gb_name}_co_region.fasta"
     reg_fasta = f"{outdir}/{gb_name}_reg_region.fasta"
-    results = run_lightmotif(reg_fasta, scoring_matrix, pvalue_threshold, thresholds_pwm)
-    write_output(results, reg_name, gb_name, "reg", outdir)
+    fastas = {"co": co_fasta, "reg": reg_fasta} if coding else {"reg": reg_fasta}
+
+    # the coding and regulatory regions are independent and can be scanned
+    # concurrently, with the batches of both sharing the same scoring threads
+    with ThreadPool(threads) as pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=len(fastas)) as executor:
+        scan = functools.partial(run_lightmotif, pssm=scoring_matrix,
+                                 pvalue_threshold=pvalue_threshold,
+                                 thresholds_pwm=thresholds_pwm, pool=pool,
+                                 cache_size=cache_size)
+        futures = {executor.submit(scan, fasta): reg_type for reg_type, fasta in fastas.items()}
+        for future in concurrent.futures.as_completed(futures):
+            write_output(future.result(), reg_name, gb_name, futures[future], outdir)
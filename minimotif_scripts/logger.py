@@ -44,6 +44,14 @@ class Logger:
        self.log(f"Execution time: {execution_time} seconds")
 
 
+def positive_int(value):
+    """ argparse type for integer arguments that must be at least 1 """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
 parser = argparse.ArgumentParser(description="", usage='''
 -_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-
 Generic command: 
@@ -76,6 +84,7 @@ Optional arguments:
         less than the global alignment between pHMM models and the query
         sequence. Default: 1
     -am Analysis mode. Default: auto (gapped, ungapped, both)
+    -t  Number of threads used for the PWM detection module. Default: all available CPUs
 -_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-_-
 ''')
 
@@ -112,6 +121,8 @@ parser.add_argument("-la", "--adjust_length", type=float,
                     help=argparse.SUPPRESS, required=False, default=1)
 parser.add_argument('-am', '--analysis_mode', help= argparse.SUPPRESS, choices=['auto', 'gapped', 'ungapped', 'both'],
                     default='auto', required=False)
+parser.add_argument("-t", "--threads", type=positive_int, help=argparse.SUPPRESS,
+                    required=False, default=None)
 
 
 args = parser.parse_args()